@@ -2,13 +2,28 @@ from fastapi import FastAPI, HTTPException
 from dotenv import load_dotenv
 from pydantic import BaseModel
 import aiomysql
-import psycopg2
-from typing import List, Dict, Optional
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+from pgvector.psycopg import register_vector_async
+from pgvector.psycopg.vector import VectorLoader, VectorBinaryLoader
+from typing import List, Dict, Optional, Tuple
 import os
-from contextlib import asynccontextmanager
-import requests
+from contextlib import asynccontextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from collections import OrderedDict
+import httpx
+import asyncio
 import numpy as np
 import logging
+import time
+import hashlib
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+import uuid
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -17,6 +32,52 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# PostgreSQL pool configuration
+PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "1"))
+PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "30"))
+
+# Open an async connection pool to one of the PostgreSQL databases.
+# Connections are checked on checkout so a dropped connection is replaced rather than handed out.
+async def create_pg_pool(database: str, configure=None) -> AsyncConnectionPool:
+    pool = AsyncConnectionPool(
+        conninfo=make_conninfo(
+            host=os.getenv("PG_HOST"),
+            port=int(os.getenv("PG_PORT")),
+            user=os.getenv("PG_USER"),
+            password=os.getenv("PG_PASSWORD"),
+            dbname=database
+        ),
+        min_size=PG_POOL_MIN_SIZE,
+        max_size=PG_POOL_MAX_SIZE,
+        timeout=PG_POOL_TIMEOUT,
+        check=AsyncConnectionPool.check_connection,
+        configure=configure,
+        name=database,
+        open=False
+    )
+    await pool.open(wait=True)
+    return pool
+
+# Loaders that return vector columns as numpy arrays instead of pgvector.Vector objects
+class NumpyVectorLoader(VectorLoader):
+    def load(self, data) -> np.ndarray:
+        return super().load(data).to_numpy()
+
+class NumpyVectorBinaryLoader(VectorBinaryLoader):
+    def load(self, data) -> np.ndarray:
+        return super().load(data).to_numpy()
+
+# Register pgvector's binary adapters so numpy embeddings are sent and read in pgvector's
+# binary format rather than as text literals of 4096 floats
+async def configure_pgvector(conn):
+    await register_vector_async(conn)
+    vector_oid = conn.adapters.types["vector"].oid
+    conn.adapters.register_loader(vector_oid, NumpyVectorLoader)
+    conn.adapters.register_loader(vector_oid, NumpyVectorBinaryLoader)
+    # The type lookups above opened a transaction; the pool expects an idle connection
+    await conn.commit()
+
 # Application Lifespan Management
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -29,25 +90,27 @@ async def lifespan(app: FastAPI):
         minsize=1,
         maxsize=10
     )
-    app.state.pgv_pool = psycopg2.connect(
-        host=os.getenv("PG_HOST"),
-        port=int(os.getenv("PG_PORT")),
-        user=os.getenv("PG_USER"),
-        password=os.getenv("PG_PASSWORD"),
-        database=os.getenv("PGVECTOR_DB_NAME")
-    )
-    app.state.pg_pool = psycopg2.connect(
-        host=os.getenv("PG_HOST"),
-        port=int(os.getenv("PG_PORT")),
-        user=os.getenv("PG_USER"),
-        password=os.getenv("PG_PASSWORD"),
-        database=os.getenv("PG_DB_NAME")
-    )
+    app.state.pgv_pool = await create_pg_pool(os.getenv("PGVECTOR_DB_NAME"), configure=configure_pgvector)
+    app.state.pg_pool = await create_pg_pool(os.getenv("PG_DB_NAME"))
+    app.state.embedding_client = create_embedding_client()
+    app.state.query_embedding_cache = QueryEmbeddingCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+    app.state.query_embedding_flights = SingleFlight()
+    app.state.embedding_dedupe = TextDedupeCounter()
+    # Shared by every background job's embedding requests, so /search queries are not queued behind them
+    app.state.sync_embed_limiter = asyncio.Semaphore(SYNC_EMBED_CONCURRENCY)
+    app.state.embedding_store = EmbeddingStore(EMBEDDING_STORE_PATH, EMBEDDING_STORE_DTYPE) if EMBEDDING_STORE_PATH else None
+    app.state.sync_jobs = OrderedDict()
     yield
+    for job in app.state.sync_jobs.values():
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+    await app.state.embedding_client.aclose()
+    if app.state.embedding_store is not None:
+        app.state.embedding_store.close()
     app.state.mysql_pool.close()
     await app.state.mysql_pool.wait_closed()
-    app.state.pgv_pool.close()
-    app.state.pg_pool.close()
+    await app.state.pgv_pool.close()
+    await app.state.pg_pool.close()
 
 app = FastAPI(
     title="PVRA API",
@@ -78,56 +141,504 @@ class SearchResponse(BaseModel):
     results: List[SearchResult]
     total_results: int
 
-# Helper function to get embeddings and ensure correct dimensionality
-def get_embeddings(text: str, expected_dim: int = 4096) -> List[float]:
-    host = os.getenv("EMBEDDING_MODEL_HOST")
-    api_key = os.getenv("EMBEDDING_API_KEY")
-    model_name = os.getenv("EMBEDDING_MODEL_NAME")
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
+# Embedding batch configuration
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "4096"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "8192"))
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "60"))
+EMBEDDING_CONNECT_TIMEOUT = float(os.getenv("EMBEDDING_CONNECT_TIMEOUT", "5"))
+EMBEDDING_MAX_CONNECTIONS = int(os.getenv("EMBEDDING_MAX_CONNECTIONS", "20"))
+EMBEDDING_MAX_KEEPALIVE = int(os.getenv("EMBEDDING_MAX_KEEPALIVE", "10"))
+
+# Shared async HTTP client for the embedding service, keeps connections alive between calls
+def create_embedding_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=os.getenv("EMBEDDING_MODEL_HOST", ""),
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {os.getenv('EMBEDDING_API_KEY')}"
+        },
+        limits=httpx.Limits(
+            max_connections=EMBEDDING_MAX_CONNECTIONS,
+            max_keepalive_connections=EMBEDDING_MAX_KEEPALIVE
+        ),
+        timeout=httpx.Timeout(EMBEDDING_TIMEOUT, connect=EMBEDDING_CONNECT_TIMEOUT)
+    )
+
+TOKEN_PIECE_PATTERN = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+# Cheap local token estimate, only used to pack batches. Mirrors how subword tokenizers split text:
+# ASCII words take about one token per 4 letters, numbers one per 3 digits, and punctuation and
+# non-ASCII characters (accented or CJK text) one each, which errs on the high side.
+def estimate_tokens(text: str) -> int:
+    tokens = 0
+    for piece in TOKEN_PIECE_PATTERN.findall(text):
+        if piece.isascii() and piece.isalpha():
+            tokens += (len(piece) + 3) // 4
+        elif piece.isdigit():
+            tokens += (len(piece) + 2) // 3
+        else:
+            tokens += 1
+    return max(1, tokens)
+
+# Cut text down to about max_tokens estimated tokens
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    tokens = 0
+    for match in TOKEN_PIECE_PATTERN.finditer(text):
+        piece_tokens = estimate_tokens(match.group())
+        if tokens + piece_tokens > max_tokens:
+            # Cut inside a piece that doesn't fit (e.g. a very long word) at ~4 characters per token
+            return text[:min(match.end(), match.start() + (max_tokens - tokens) * 4)]
+        tokens += piece_tokens
+    return text
+
+# Group text indexes into batches bounded by item count and estimated tokens. Texts are packed
+# shortest first, so each batch holds texts of similar length and the server pads less.
+def build_embedding_batches(texts: List[str], batch_size: int, max_tokens: int) -> List[List[int]]:
+    batches = []
+    current = []
+    current_tokens = 0
+    token_counts = [estimate_tokens(text) for text in texts]
+    for i in sorted(range(len(texts)), key=token_counts.__getitem__):
+        tokens = token_counts[i]
+        if current and (len(current) >= batch_size or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+# Helper function to ensure correct dimensionality of a single embedding
+def fit_embedding_dimension(embedding: List[float], expected_dim: int) -> np.ndarray:
+    embedding = np.asarray(embedding, dtype=np.float32)
+    if len(embedding) != expected_dim:
+        logger.warning(f"Embedding has wrong dimensions (got {len(embedding)}, expected {expected_dim}). Padding with zeros.")
+        embedding = np.pad(embedding, (0, max(0, expected_dim - len(embedding))), mode='constant')
+    return embedding
+
+# Whether the embedding service rejected a request for being too large (too many inputs or tokens)
+def is_batch_too_large(response: httpx.Response) -> bool:
+    if response.status_code == 413:
+        return True
+    return response.status_code == 400 and re.search(
+        r"too (large|long|many)|maximum|context length|token", response.text, re.IGNORECASE
+    ) is not None
+
+# Helper function to embed a single batch, mapping results back onto the shared output list.
+# A batch the service rejects as too large is split in half and retried; a single text it rejects
+# is truncated and retried, so one over-long row cannot fail every sync that reaches it.
+# A limiter, when given, is held for the request so callers can bound their requests in flight.
+async def _embed_batch(
+    client: httpx.AsyncClient,
+    texts: List[str],
+    batch: List[int],
+    embeddings: List[Optional[np.ndarray]],
+    expected_dim: int,
+    raise_on_error: bool = False,
+    limiter: Optional[asyncio.Semaphore] = None
+):
     data = {
-        "model": model_name,
-        "input": text
+        "model": os.getenv("EMBEDDING_MODEL_NAME"),
+        "input": [texts[i] for i in batch]
     }
     try:
-        response = requests.post(
-            f"{host}/embeddings",
-            headers=headers,
-            json=data,
-            timeout=10
-        )
+        async with limiter or nullcontext():
+            response = await client.post("/embeddings", json=data)
         response.raise_for_status()
         result = response.json()
-        logger.info(f"Embedding response: {result}")
-        embedding = result.get("data", [{}])[0].get("embedding", [])
-        if not embedding or len(embedding) != expected_dim:
-            logger.warning(f"Embedding has wrong dimensions (got {len(embedding)}, expected {expected_dim}). Padding with zeros.")
-            embedding = np.pad(embedding, (0, max(0, expected_dim - len(embedding))), mode='constant').tolist()
-        return embedding
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Embedding service error: {str(e)}, Response: {e.response.text if e.response else 'No response'}")
-        # Return zero vector of expected dimension on failure
-        return [0.0] * expected_dim
-
-# Helper function to update embeddings in pgvector database
-def update_embeddings_in_pgv(pgv_conn, question_id: int, question: str, answer: str):
-    question_embedding = get_embeddings(question)
-    answer_embedding = get_embeddings(answer) if answer else get_embeddings("")
-    
-    logger.debug(f"Updating embeddings - question_id: {question_id}, question_embedding length: {len(question_embedding)}, answer_embedding length: {len(answer_embedding)}")
-    
-    with pgv_conn.cursor() as cursor:
-        cursor.execute(
+        items = result.get("data", [])
+        logger.debug(f"Embedding response: {len(items)} embeddings for batch of {len(batch)}")
+        for position, item in enumerate(items):
+            # The API may reorder results, so map them back by their index
+            index = item.get("index", position)
+            if 0 <= index < len(batch):
+                embeddings[batch[index]] = fit_embedding_dimension(item.get("embedding", []), expected_dim)
+    except httpx.HTTPStatusError as e:
+        if len(batch) > 1 and is_batch_too_large(e.response):
+            logger.warning(f"Embedding batch of {len(batch)} rejected as too large, splitting: {e.response.text}")
+            middle = len(batch) // 2
+            await asyncio.gather(
+                _embed_batch(client, texts, batch[:middle], embeddings, expected_dim, raise_on_error, limiter),
+                _embed_batch(client, texts, batch[middle:], embeddings, expected_dim, raise_on_error, limiter)
+            )
+            return
+        if len(batch) == 1 and is_batch_too_large(e.response):
+            text = texts[batch[0]]
+            tokens = estimate_tokens(text)
+            # First cut to the batch token budget, then halve until the service accepts it
+            budget = EMBEDDING_BATCH_MAX_TOKENS if tokens > EMBEDDING_BATCH_MAX_TOKENS else tokens // 2
+            truncated = truncate_to_tokens(text, budget)
+            if truncated and len(truncated) < len(text):
+                logger.warning(f"Embedding input rejected as too large, retrying truncated to ~{budget} tokens")
+                result: List[Optional[np.ndarray]] = [None]
+                await _embed_batch(client, [truncated], [0], result, expected_dim, raise_on_error, limiter)
+                embeddings[batch[0]] = result[0]
+                return
+        logger.error(f"Embedding service error: {str(e)}, Response: {e.response.text}")
+        if raise_on_error:
+            raise
+    except httpx.HTTPError as e:
+        logger.error(f"Embedding service error: {str(e)}, Response: No response")
+        if raise_on_error:
+            raise
+
+    for i in batch:
+        if embeddings[i] is None:
+            if raise_on_error:
+                raise ValueError(f"Embedding service returned no embedding for input {i}")
+            # Return zero vector of expected dimension on failure
+            embeddings[i] = np.zeros(expected_dim, dtype=np.float32)
+
+# Helper function to get embeddings for many texts, packing them into batched requests
+async def get_embeddings_batch(
+    client: httpx.AsyncClient,
+    texts: List[str],
+    expected_dim: int = EMBEDDING_DIM,
+    batch_size: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+    raise_on_error: bool = False,
+    limiter: Optional[asyncio.Semaphore] = None
+) -> List[np.ndarray]:
+    embeddings: List[Optional[np.ndarray]] = [None] * len(texts)
+    batches = build_embedding_batches(
+        texts,
+        batch_size or EMBEDDING_BATCH_SIZE,
+        max_tokens or EMBEDDING_BATCH_MAX_TOKENS
+    )
+    # Batches run concurrently; the limiter, or else the client's connection limits, bound how many are in flight
+    await asyncio.gather(*(
+        _embed_batch(client, texts, batch, embeddings, expected_dim, raise_on_error, limiter)
+        for batch in batches
+    ))
+    return embeddings
+
+# Persistent embedding store configuration
+EMBEDDING_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", ".cache/embedding_store.sqlite3")
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float16")
+
+# On-disk, content-addressed embedding cache shared by all workers on the host.
+# SQLite in WAL mode lets several uvicorn processes read and write the same file.
+class EmbeddingStore:
+    def __init__(self, path: str, dtype: str = "float16"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB PRIMARY KEY,
+                dtype TEXT NOT NULL,
+                vector BLOB NOT NULL
+            )
             """
-            UPDATE genie_documents
-            SET question_embedding = %s::vector, answer_embedding = %s::vector
-            WHERE id = %s
-            """,
-            (question_embedding, answer_embedding, question_id)
         )
-    pgv_conn.commit()
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name: str, dim: int, text: str) -> bytes:
+        return hashlib.sha256(f"{model_name}\0{dim}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, model_name: str, dim: int, texts: List[str]) -> List[Optional[np.ndarray]]:
+        keys = [self.make_key(model_name, dim, text) for text in texts]
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            # Stay well below SQLite's bound parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for key, dtype, blob in self._conn.execute(
+                    f"SELECT key, dtype, vector FROM embeddings WHERE key IN ({placeholders})",
+                    chunk
+                ):
+                    found[key] = np.frombuffer(blob, dtype=dtype).astype(np.float32)
+        embeddings = [found.get(key) for key in keys]
+        hits = sum(1 for embedding in embeddings if embedding is not None)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return embeddings
+
+    def put_many(self, model_name: str, dim: int, texts: List[str], embeddings: List[np.ndarray]):
+        # Zero vectors mean the embedding call failed, so never persist them
+        rows = [
+            (self.make_key(model_name, dim, text), self.dtype.name, np.asarray(embedding, dtype=self.dtype).tobytes())
+            for text, embedding in zip(texts, embeddings)
+            if np.any(embedding)
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dtype, vector) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "dtype": self.dtype.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# Counts texts passed to embed_texts against the distinct texts actually looked up and embedded
+class TextDedupeCounter:
+    def __init__(self):
+        self.texts = 0
+        self.unique_texts = 0
+
+    def record(self, texts: int, unique_texts: int):
+        self.texts += texts
+        self.unique_texts += unique_texts
+
+    def stats(self) -> Dict:
+        return {
+            "texts": self.texts,
+            "unique_texts": self.unique_texts,
+            # Share of texts that reused another text's embedding instead of being embedded again
+            "dedupe_ratio": 1 - self.unique_texts / self.texts if self.texts else 0.0
+        }
+
+# Helper function to embed texts, consulting the persistent store before the embedding service.
+# With raise_on_error, a failed request raises instead of falling back to zero vectors.
+# Empty or whitespace-only texts have nothing to embed and come back as None without a request.
+# Each distinct text is looked up and embedded once and its vector shared by every position using it.
+async def embed_texts(
+    texts: List[str],
+    expected_dim: int = EMBEDDING_DIM,
+    raise_on_error: bool = False,
+    dedupe: Optional[TextDedupeCounter] = None,
+    limiter: Optional[asyncio.Semaphore] = None
+) -> List[Optional[np.ndarray]]:
+    embeddings: List[Optional[np.ndarray]] = [None] * len(texts)
+    positions: Dict[str, List[int]] = {}
+    for i, text in enumerate(texts):
+        if text and text.strip():
+            positions.setdefault(text, []).append(i)
+    if not positions:
+        return embeddings
+
+    text_count = sum(len(indexes) for indexes in positions.values())
+    for counter in (app.state.embedding_dedupe, dedupe):
+        if counter is not None:
+            counter.record(text_count, len(positions))
+    texts = list(positions)
+    unique_embeddings = await _embed_unique_texts(texts, expected_dim, raise_on_error, limiter)
+    for text, embedding in zip(texts, unique_embeddings):
+        for i in positions[text]:
+            embeddings[i] = embedding
+    return embeddings
+
+# Helper function to embed distinct, non-empty texts through the persistent store and the embedding service
+async def _embed_unique_texts(
+    texts: List[str],
+    expected_dim: int,
+    raise_on_error: bool,
+    limiter: Optional[asyncio.Semaphore]
+) -> List[np.ndarray]:
+    client = app.state.embedding_client
+    store = app.state.embedding_store
+    if store is None:
+        return await get_embeddings_batch(client, texts, expected_dim, raise_on_error=raise_on_error, limiter=limiter)
+
+    model_name = os.getenv("EMBEDDING_MODEL_NAME") or ""
+    stored = await asyncio.to_thread(store.get_many, model_name, expected_dim, texts)
+    missing = [i for i, embedding in enumerate(stored) if embedding is None]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        fetched = await get_embeddings_batch(client, missing_texts, expected_dim, raise_on_error=raise_on_error, limiter=limiter)
+        for i, embedding in zip(missing, fetched):
+            stored[i] = embedding
+        await asyncio.to_thread(store.put_many, model_name, expected_dim, missing_texts, fetched)
+    return stored
+
+# Query embedding cache configuration
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+
+# Bounded LRU cache of query embeddings with per-entry expiry
+class QueryEmbeddingCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, np.ndarray]]" = OrderedDict()
+
+    def get(self, model_name: str, text: str) -> Optional[np.ndarray]:
+        key = (model_name, text)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, model_name: str, text: str, embedding: np.ndarray):
+        # Zero vectors mean the embedding call failed, so never cache them
+        if self.max_size <= 0 or not np.any(embedding):
+            return
+        key = (model_name, text)
+        self._entries[key] = (time.monotonic() + self.ttl, embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+# Coalesces identical concurrent calls so they share one in-flight result
+class SingleFlight:
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._in_flight: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    async def do(self, key: Tuple[str, str], fn):
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.shared += 1
+        # Shield so one cancelled caller (e.g. a disconnected client) doesn't cancel the others
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._in_flight),
+            "calls": self.calls,
+            "shared": self.shared
+        }
+
+# Collapse whitespace so trivially different queries share a cache entry
+def normalize_query_text(text: str) -> str:
+    return " ".join(text.split())
+
+# Helper function to get a query embedding, served from the cache when possible
+async def get_query_embedding(text: str) -> Optional[np.ndarray]:
+    model_name = os.getenv("EMBEDDING_MODEL_NAME") or ""
+    normalized = normalize_query_text(text)
+    cache = app.state.query_embedding_cache
+    embedding = cache.get(model_name, normalized)
+    if embedding is not None:
+        return embedding
+
+    async def compute() -> Optional[np.ndarray]:
+        # An empty query has no embedding and matches no documents
+        result = (await embed_texts([normalized]))[0]
+        if result is not None:
+            cache.put(model_name, normalized, result)
+        return result
+
+    return await app.state.query_embedding_flights.do((model_name, normalized), compute)
+
+# Vector index configuration
+# "exact" scans every row with full-precision vectors (works with the plain vector(4096) schema).
+# "halfvec_hnsw" expects the schema from migrate_halfvec_hnsw.sql: halfvec columns indexed by HNSW
+# over their binary quantization, since HNSW cannot index more than 4000 halfvec dimensions.
+VECTOR_INDEX_MODE = os.getenv("VECTOR_INDEX_MODE", "exact").lower()
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))
+HNSW_CANDIDATE_FACTOR = int(os.getenv("HNSW_CANDIDATE_FACTOR", "10"))
+HNSW_MAX_EF_SEARCH = 1000  # pgvector's upper bound for hnsw.ef_search
+
+# Build the similarity search SQL for the configured index mode
+def build_search_query() -> str:
+    if VECTOR_INDEX_MODE == "halfvec_hnsw":
+        # Take candidates from the HNSW index by Hamming distance, then re-rank them by cosine distance
+        return f"""
+            SELECT question, answer, link, date, 1 - distance AS similarity_score
+            FROM (
+                SELECT
+                    question,
+                    answer,
+                    link,
+                    date,
+                    question_embedding <=> %(embedding)b::halfvec({EMBEDDING_DIM}) AS distance
+                FROM (
+                    SELECT question, answer, link, date, question_embedding
+                    FROM genie_documents
+                    WHERE question_embedding IS NOT NULL
+                    ORDER BY binary_quantize(question_embedding)::bit({EMBEDDING_DIM})
+                        <~> binary_quantize(%(embedding)b::halfvec({EMBEDDING_DIM}))
+                    LIMIT %(candidates)s
+                ) candidates
+                ORDER BY distance
+                LIMIT %(limit)s
+            ) reranked
+            WHERE 1 - distance > %(threshold)s
+            ORDER BY distance
+        """
+    # Order by the raw distance so pgvector can serve the LIMIT from an index scan;
+    # the similarity threshold is applied to the nearest rows afterwards
+    return """
+        SELECT question, answer, link, date, 1 - distance AS similarity_score
+        FROM (
+            SELECT 
+                question, 
+                answer, 
+                link, 
+                date,
+                question_embedding <=> %(embedding)b AS distance
+            FROM genie_documents
+            WHERE question_embedding IS NOT NULL
+            ORDER BY distance
+            LIMIT %(limit)s
+        ) nearest
+        WHERE 1 - distance > %(threshold)s
+        ORDER BY distance
+    """
+
+# Helper function to run a cosine similarity search against genie_documents
+async def search_similar_documents(pgv_conn, embedding: np.ndarray, limit: Optional[int], threshold: float) -> List[tuple]:
+    params = {
+        "embedding": embedding,
+        "threshold": threshold,
+        "limit": limit
+    }
+    async with pgv_conn.cursor() as cursor:
+        if VECTOR_INDEX_MODE == "halfvec_hnsw":
+            # A missing limit takes the request default; pgvector rejects ef_search above 1000
+            if limit is None:
+                params["limit"] = limit = SearchRequest.model_fields["limit"].default
+            candidates = min(limit * HNSW_CANDIDATE_FACTOR, HNSW_MAX_EF_SEARCH)
+            params["candidates"] = candidates
+            # ef_search caps how many rows the HNSW scan returns, so keep it above the candidate count
+            await cursor.execute(
+                "SELECT set_config('hnsw.ef_search', %s, true)",
+                (str(min(max(HNSW_EF_SEARCH, candidates), HNSW_MAX_EF_SEARCH)),)
+            )
+        await cursor.execute(build_search_query(), params)
+        return await cursor.fetchall()
 
 @app.get('/documents')
 async def get_documents():
@@ -173,32 +684,17 @@ async def search_knowledge_base(request: SearchRequest):
     """
     try:
         # Get embedding for the query
-        query_embedding = get_embeddings(request.query)
+        query_embedding = await get_query_embedding(request.query)
         
         # Perform similarity search in pgvector
-        pgv_conn = app.state.pgv_pool
-        
-        with pgv_conn.cursor() as cursor:
-            # Use cosine similarity for search
-            cursor.execute(
-                """
-                SELECT 
-                    question, 
-                    answer, 
-                    link, 
-                    date,
-                    1 - (question_embedding <=> %s::vector) as similarity_score
-                FROM genie_documents
-                WHERE question_embedding IS NOT NULL
-                    AND 1 - (question_embedding <=> %s::vector) > %s
-                ORDER BY similarity_score DESC
-                LIMIT %s
-                """,
-                (query_embedding, query_embedding, request.similarity_threshold, request.limit)
+        async with app.state.pgv_pool.connection() as pgv_conn:
+            rows = await search_similar_documents(
+                pgv_conn,
+                query_embedding,
+                request.limit,
+                request.similarity_threshold
             )
             
-            rows = cursor.fetchall()
-            
             results = []
             for row in rows:
                 results.append(SearchResult(
@@ -214,13 +710,13 @@ async def search_knowledge_base(request: SearchRequest):
                 total_results=len(results)
             )
             
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         logger.error(f"PostgreSQL error during search: {str(e)}")
         raise HTTPException(
             status_code=503,
             detail=f"Database search error: {str(e)}"
         )
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Embedding service error during search: {str(e)}")
         raise HTTPException(
             status_code=503,
@@ -241,31 +737,17 @@ async def search_knowledge_base_simple(request: SearchRequest):
     """
     try:
         # Get embedding for the query
-        query_embedding = get_embeddings(request.query)
+        query_embedding = await get_query_embedding(request.query)
         
         # Perform similarity search in pgvector
-        pgv_conn = app.state.pgv_pool
-        
-        with pgv_conn.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT 
-                    question, 
-                    answer, 
-                    link, 
-                    date,
-                    1 - (question_embedding <=> %s::vector) as similarity_score
-                FROM genie_documents
-                WHERE question_embedding IS NOT NULL
-                    AND 1 - (question_embedding <=> %s::vector) > %s
-                ORDER BY similarity_score DESC
-                LIMIT %s
-                """,
-                (query_embedding, query_embedding, request.similarity_threshold, request.limit)
+        async with app.state.pgv_pool.connection() as pgv_conn:
+            rows = await search_similar_documents(
+                pgv_conn,
+                query_embedding,
+                request.limit,
+                request.similarity_threshold
             )
             
-            rows = cursor.fetchall()
-            
             if not rows:
                 return {
                     "context": "No relevant information found in the knowledge base.",
@@ -307,13 +789,13 @@ async def search_knowledge_base_simple(request: SearchRequest):
                 "total_results": len(rows)
             }
             
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         logger.error(f"PostgreSQL error during search: {str(e)}")
         raise HTTPException(
             status_code=503,
             detail=f"Database search error: {str(e)}"
         )
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Embedding service error during search: {str(e)}")
         raise HTTPException(
             status_code=503,
@@ -326,132 +808,1105 @@ async def search_knowledge_base_simple(request: SearchRequest):
             detail=f"Search error: {str(e)}"
         )
 
-@app.post('/documents/sync-embeddings')
-async def sync_embeddings():
-    try:
-        # Get the last migrated ID from PostgreSQL with transaction handling
-        last_migrated_id = 0
-        with app.state.pg_pool.cursor() as pg_cursor:
-            try:
-                pg_cursor.execute("SELECT COALESCE(MAX(id_migrated), 0) FROM migration_tracker")
-                last_migrated_id = pg_cursor.fetchone()[0]
-            except psycopg2.Error as e:
-                logger.error(f"Permission or table error on migration_tracker: {str(e)}")
-                app.state.pg_pool.rollback()  # Rollback to clear aborted state
-                raise HTTPException(
-                    status_code=503,
-                    detail=f"Permission denied or table migration_tracker missing: {str(e)}"
-                )
+# Sync configuration
+SYNC_CHUNK_SIZE = int(os.getenv("SYNC_CHUNK_SIZE", "500"))
+SYNC_EMBED_CONCURRENCY = int(os.getenv("SYNC_EMBED_CONCURRENCY", "4"))
+SYNC_QUEUE_SIZE = int(os.getenv("SYNC_QUEUE_SIZE", "4"))
 
+# Stream MySQL rows after the given id in id order, one keyset page at a time,
+# so memory stays bounded by the chunk size rather than the table size
+async def iter_mysql_rows(after_id: int, chunk_size: int = SYNC_CHUNK_SIZE, until_id: Optional[int] = None):
+    # until_id bounds the scan to one id range for parallel sync workers
+    upper_bound = until_id if until_id is not None else 2**63 - 1
+    while True:
         async with app.state.mysql_pool.acquire() as mysql_conn:
             async with mysql_conn.cursor(aiomysql.DictCursor) as mysql_cursor:
-                # Fetch rows from MySQL based on the last migrated ID from PostgreSQL
                 await mysql_cursor.execute("""
                     SELECT id, genie_question, genie_answer, genie_questiondate, genie_sourcelink
                     FROM tbl_genie_genie
-                    WHERE id > %s
-                """, (last_migrated_id,))
+                    WHERE id > %s AND id <= %s
+                    ORDER BY id
+                    LIMIT %s
+                """, (after_id, upper_bound, chunk_size))
                 rows = await mysql_cursor.fetchall()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        after_id = rows[-1]['id']
+
+# MySQL DATE values come back as date objects; the staging table expects timestamps
+def to_timestamp(value) -> Optional[datetime]:
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, datetime.min.time())
+    return value
+
+# Hash of the fields a document is built from, used to detect edited MySQL rows
+def compute_content_hash(question: Optional[str], answer: Optional[str], link: Optional[str], date_value) -> str:
+    timestamp = to_timestamp(date_value)
+    parts = [question or "", answer or "", link or "", timestamp.isoformat() if timestamp else ""]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+# Helper function to save the last synced id in the current transaction of pgv_conn.
+# GREATEST keeps a "changes" rescan from moving the checkpoint backwards.
+async def save_sync_checkpoint(pgv_conn, last_id: int):
+    await pgv_conn.execute(
+        """
+        INSERT INTO sync_checkpoint (source_table, id_migrated, updated_at)
+        VALUES (%s, %s, NOW())
+        ON CONFLICT (source_table) DO UPDATE SET
+            id_migrated = GREATEST(sync_checkpoint.id_migrated, EXCLUDED.id_migrated),
+            updated_at = EXCLUDED.updated_at
+        """,
+        (SYNC_SOURCE_TABLE, last_id)
+    )
+
+# Helper function to bulk upsert documents with their embeddings: COPY into a staging table,
+# then a single set-based INSERT ... ON CONFLICT, committed once for the whole batch. A checkpoint id
+# is saved in the same transaction, so it never gets ahead of (or behind) the committed documents.
+async def bulk_upsert_documents(pgv_conn, documents: List[Tuple], checkpoint: Optional[int] = None):
+    if not documents and checkpoint is None:
+        return
+
+    async with pgv_conn.cursor() as cursor:
+        if checkpoint is not None:
+            await save_sync_checkpoint(pgv_conn, checkpoint)
+        if not documents:
+            await pgv_conn.commit()
+            return
+
+        # Staging columns are plain vector so the binary COPY matches pgvector's dumper;
+        # the INSERT casts to halfvec when the table has been migrated
+        await cursor.execute(
+            """
+            CREATE TEMP TABLE genie_documents_staging (
+                source_id INTEGER,
+                question TEXT,
+                answer TEXT,
+                link TEXT,
+                date TIMESTAMP,
+                content_hash TEXT,
+                question_embedding VECTOR,
+                answer_embedding VECTOR
+            ) ON COMMIT DROP
+            """
+        )
+        async with cursor.copy(
+            """
+            COPY genie_documents_staging (source_id, question, answer, link, date, content_hash, question_embedding, answer_embedding)
+            FROM STDIN WITH (FORMAT BINARY)
+            """
+        ) as copy:
+            copy.set_types(["int4", "text", "text", "text", "timestamp", "text", "vector", "vector"])
+            for document in documents:
+                await copy.write_row(document)
+        await cursor.execute(
+            """
+            INSERT INTO genie_documents (source_id, question, answer, link, date, content_hash, question_embedding, answer_embedding)
+            SELECT source_id, question, answer, link, date, content_hash, question_embedding, answer_embedding
+            FROM genie_documents_staging
+            ON CONFLICT (source_id) DO UPDATE SET
+                question = EXCLUDED.question,
+                answer = EXCLUDED.answer,
+                link = EXCLUDED.link,
+                date = EXCLUDED.date,
+                content_hash = EXCLUDED.content_hash,
+                question_embedding = EXCLUDED.question_embedding,
+                answer_embedding = EXCLUDED.answer_embedding
+            """
+        )
+    await pgv_conn.commit()
 
-        # Use pre-existing PostgreSQL connections from app state
-        pgv_conn = app.state.pgv_pool
-        pg_conn = app.state.pg_pool
+# Helper function to turn one chunk of MySQL rows into documents with embeddings, ready to write.
+# Rows whose content hash matches the stored document are skipped, so only new or edited rows are embedded.
+async def prepare_documents(rows: List[Dict], dedupe: Optional[TextDedupeCounter] = None) -> List[Tuple]:
+    # ON CONFLICT cannot touch the same row twice in one statement, so keep the last change per id
+    rows_by_id = {row['id']: row for row in rows}
+
+    async with app.state.pgv_pool.connection() as pgv_conn, pgv_conn.cursor() as pgv_cursor:
+        # Existence is checked for this chunk's ids only, through the unique source_id index.
+        # Documents synced before source_id existed are matched by question instead.
+        await pgv_cursor.execute(
+            """
+            SELECT source_id, question, answer, link, date, content_hash
+            FROM genie_documents
+            WHERE source_id = ANY(%s)
+                OR (source_id IS NULL AND question = ANY(%s))
+            """,
+            (list(rows_by_id), [row.get('genie_question') or "" for row in rows_by_id.values()])
+        )
+        stored_hashes: Dict[int, str] = {}
+        legacy_hashes: Dict[str, str] = {}
+        for source_id, question, answer, link, stored_date, stored_hash in await pgv_cursor.fetchall():
+            # Documents written before content hashes existed are hashed from their stored fields
+            stored_hash = stored_hash or compute_content_hash(question, answer, link, stored_date)
+            if source_id is None:
+                legacy_hashes[question] = stored_hash
+            else:
+                stored_hashes[source_id] = stored_hash
 
+        # Claim legacy documents for their MySQL row so the upsert below updates them in place;
+        # each legacy document can only be claimed by one row
+        claims: Dict[str, int] = {}
+        for source_id, row in rows_by_id.items():
+            question = row.get('genie_question') or ""
+            if source_id not in stored_hashes and question in legacy_hashes and question not in claims:
+                claims[question] = source_id
+        if claims:
+            await pgv_cursor.execute(
+                """
+                UPDATE genie_documents d
+                SET source_id = c.source_id
+                FROM unnest(%s::int[], %s::text[]) AS c(source_id, question)
+                WHERE d.source_id IS NULL AND d.question = c.question
+                RETURNING d.source_id, d.question
+                """,
+                (list(claims.values()), list(claims))
+            )
+            # A concurrent chunk may have claimed the same document first
+            for source_id, question in await pgv_cursor.fetchall():
+                stored_hashes[source_id] = legacy_hashes[question]
+
+    changed_rows: List[Tuple[Dict, str]] = []
+    for source_id, row in rows_by_id.items():
+        row_hash = compute_content_hash(
+            row.get('genie_question'),
+            row.get('genie_answer'),
+            row.get('genie_sourcelink'),
+            row.get('genie_questiondate')
+        )
+        if stored_hashes.get(source_id) == row_hash:
+            continue  # Skip if the document is already up to date
+        changed_rows.append((row, row_hash))
+
+    if not changed_rows:
+        return []
+
+    questions = [row.get('genie_question') or "" for row, _ in changed_rows]
+    answers = [row.get('genie_answer') or "" for row, _ in changed_rows]
+    # Questions and answers for the whole chunk are embedded together. A failed request fails the
+    # chunk rather than storing zero vectors, so a sync stops at its last checkpointed batch.
+    embeddings = await embed_texts(
+        questions + answers,
+        raise_on_error=True,
+        dedupe=dedupe,
+        limiter=app.state.sync_embed_limiter
+    )
+
+    return [
+        (
+            row['id'],
+            questions[i],
+            answers[i],
+            row.get('genie_sourcelink'),
+            to_timestamp(row.get('genie_questiondate')),
+            row_hash,
+            embeddings[i],
+            embeddings[len(changed_rows) + i]
+        )
+        for i, (row, row_hash) in enumerate(changed_rows)
+    ]
+
+# Pipelined sync: MySQL reads, embedding and PostgreSQL writes run as separate stages
+# connected by bounded queues, so the embedding service stays busy while both databases
+# are being read and written. Returns the number of rows synced and the last id written.
+# until_id and checkpoint=False let a parallel sync worker process one id range without
+# moving the shared checkpoint.
+async def run_sync_pipeline(
+    after_id: int,
+    job: Optional["SyncJob"] = None,
+    until_id: Optional[int] = None,
+    checkpoint: bool = True
+) -> Tuple[int, int]:
+    read_queue: asyncio.Queue = asyncio.Queue(maxsize=SYNC_QUEUE_SIZE)
+    write_queue: asyncio.Queue = asyncio.Queue(maxsize=SYNC_QUEUE_SIZE)
+    # Bounds the chunks held anywhere in the pipeline, including ones waiting to be written in order
+    in_flight = asyncio.Semaphore(SYNC_QUEUE_SIZE + SYNC_EMBED_CONCURRENCY)
+    synced = 0
+    high_water_mark = after_id
+
+    async def read_stage():
+        seq = 0
+        async for rows in iter_mysql_rows(after_id, until_id=until_id):
+            if job is not None:
+                job.rows_read += len(rows)
+            await in_flight.acquire()
+            await read_queue.put((seq, rows))
+            seq += 1
+        for _ in range(SYNC_EMBED_CONCURRENCY):
+            await read_queue.put(None)
+
+    async def embed_stage():
+        while (item := await read_queue.get()) is not None:
+            seq, rows = item
+            documents = await prepare_documents(rows, job.dedupe if job is not None else None)
+            if job is not None:
+                job.rows_embedded += len(rows)
+            await write_queue.put((seq, rows, documents))
+        await write_queue.put(None)
+
+    async def write_stage():
+        nonlocal synced, high_water_mark
+        pending: Dict[int, Tuple] = {}
+        next_seq = 0
+        finished = 0
+        async with app.state.pgv_pool.connection() as pgv_conn:
+            while finished < SYNC_EMBED_CONCURRENCY:
+                item = await write_queue.get()
+                if item is None:
+                    finished += 1
+                    continue
+                pending[item[0]] = item
+                # Chunks finish embedding out of order; write them in id order
+                while next_seq in pending:
+                    _, rows, documents = pending.pop(next_seq)
+                    await bulk_upsert_documents(pgv_conn, documents, checkpoint=rows[-1]['id'] if checkpoint else None)
+                    synced += len(rows)
+                    high_water_mark = rows[-1]['id']
+                    if job is not None:
+                        job.rows_written += len(rows)
+                        job.documents_changed += len(documents)
+                    next_seq += 1
+                    in_flight.release()
+
+    tasks = [
+        asyncio.create_task(read_stage()),
+        *(asyncio.create_task(embed_stage()) for _ in range(SYNC_EMBED_CONCURRENCY)),
+        asyncio.create_task(write_stage())
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # If any stage fails, stop the others instead of leaving them blocked on a queue
+        for task in tasks:
+            task.cancel()
+    return synced, high_water_mark
+
+# Background sync job configuration
+SYNC_SOURCE_TABLE = "tbl_genie_genie"
+SYNC_JOB_HISTORY = int(os.getenv("SYNC_JOB_HISTORY", "50"))
+
+# State and progress of one background sync job
+class SyncJob:
+    def __init__(self, kind: str, source_table: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.source_table = source_table
+        self.status = "queued"
+        self.rows_total: Optional[int] = None
+        self.rows_read = 0
+        self.rows_embedded = 0
+        self.rows_written = 0
+        self.documents_changed = 0
+        self.dedupe = TextDedupeCounter()
+        self.errors: List[str] = []
+        self.result: Dict = {}
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def snapshot(self) -> Dict:
+        elapsed = None
+        throughput = None
+        eta = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            throughput = self.rows_written / elapsed if elapsed > 0 else 0.0
+            if self.active and self.rows_total is not None and throughput:
+                eta = max(0, self.rows_total - self.rows_written) / throughput
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "source_table": self.source_table,
+            "status": self.status,
+            "rows_total": self.rows_total,
+            "rows_read": self.rows_read,
+            "rows_embedded": self.rows_embedded,
+            "rows_written": self.rows_written,
+            "documents_changed": self.documents_changed,
+            "embedding_dedupe": self.dedupe.stats(),
+            "elapsed_seconds": elapsed,
+            "rows_per_second": throughput,
+            "eta_seconds": eta,
+            "errors": self.errors,
+            "result": self.result
+        }
+
+# Helper function to take the sync lock for a source table. It is a session-level advisory lock on a
+# pool connection kept for the whole job, so app processes sharing the database also see it.
+# Returns the connection holding the lock, or None when another process holds it.
+async def acquire_sync_lock(source_table: str):
+    pool = app.state.pgv_pool
+    try:
+        conn = await pool.getconn()
+    except psycopg.OperationalError as e:
+        logger.error(f"PostgreSQL connection error: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="Vector database service unavailable"
+        )
+    try:
+        cursor = await conn.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (f"sync:{source_table}",))
+        locked = (await cursor.fetchone())[0]
+        # Session-level locks outlive the transaction; don't leave the connection idle in one
+        await conn.commit()
+    except BaseException:
+        await pool.putconn(conn)
+        raise
+    if not locked:
+        await pool.putconn(conn)
+        return None
+    return conn
+
+# Helper function to release the sync lock and return its connection to the pool
+async def release_sync_lock(conn, source_table: str):
+    try:
+        await conn.execute("SELECT pg_advisory_unlock(hashtext(%s))", (f"sync:{source_table}",))
+        await conn.commit()
+    except psycopg.Error as e:
+        # A broken connection has already lost its session and the lock with it
+        logger.error(f"Failed to release sync lock for {source_table}: {str(e)}")
+    finally:
+        await app.state.pgv_pool.putconn(conn)
+
+# Register a job and run it in the background, allowing one active job per source table
+# in this process and, through the advisory lock, across all processes
+async def start_sync_job(kind: str, runner) -> SyncJob:
+    jobs: "OrderedDict[str, SyncJob]" = app.state.sync_jobs
+    for job in jobs.values():
+        if job.active and job.source_table == SYNC_SOURCE_TABLE:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Sync job {job.id} is already running for {job.source_table}"
+            )
+
+    lock_conn = await acquire_sync_lock(SYNC_SOURCE_TABLE)
+    if lock_conn is None:
+        raise HTTPException(
+            status_code=409,
+            detail=f"A sync job is already running for {SYNC_SOURCE_TABLE} in another process"
+        )
+
+    job = SyncJob(kind, SYNC_SOURCE_TABLE)
+    jobs[job.id] = job
+    # Forget the oldest finished jobs once the history is full
+    for job_id in [job_id for job_id, old_job in jobs.items() if not old_job.active][:max(0, len(jobs) - SYNC_JOB_HISTORY)]:
+        del jobs[job_id]
+
+    async def run():
+        job.status = "running"
+        job.started_at = time.time()
         try:
-            if not rows:
-                return {"status": "success", "synced": 0, "message": "No new rows to sync."}
-
-            # Check existing questions in PostgreSQL to avoid duplicates
-            existing_questions = set()
-            with pgv_conn.cursor() as pgv_cursor:
-                try:
-                    pgv_cursor.execute("SELECT question FROM genie_documents")
-                    existing_questions = {row[0] for row in pgv_cursor.fetchall()}
-                except psycopg2.Error as e:
-                    logger.error(f"Permission error on genie_documents: {str(e)}")
-                    pgv_conn.rollback()
-                    raise HTTPException(
-                        status_code=503,
-                        detail=f"Permission denied for table genie_documents: {str(e)}"
+            job.result = await runner(job)
+            job.status = "succeeded"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except aiomysql.Error as e:
+            logger.error(f"MySQL service unavailable: {str(e)}")
+            job.errors.append(f"MySQL service unavailable: {str(e)}")
+            job.status = "failed"
+        except psycopg.OperationalError as e:
+            logger.error(f"PostgreSQL connection error: {str(e)}")
+            job.errors.append(f"PostgreSQL connection error: {str(e)}")
+            job.status = "failed"
+        except psycopg.Error as e:
+            logger.error(f"PostgreSQL query error: {str(e)}")
+            job.errors.append(f"PostgreSQL query error: {str(e)}")
+            job.status = "failed"
+        except httpx.HTTPError as e:
+            logger.error(f"Embedding service unavailable: {e.response.text if isinstance(e, httpx.HTTPStatusError) else str(e)}")
+            job.errors.append(f"Embedding service unavailable: {e.response.text if isinstance(e, httpx.HTTPStatusError) else str(e)}")
+            job.status = "failed"
+        except Exception as e:
+            logger.error(f"Sync job {job.id} failed: {str(e)}")
+            job.errors.append(f"Server error: {str(e)}")
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            await release_sync_lock(lock_conn, job.source_table)
+
+    def on_done(task: asyncio.Task):
+        # A task cancelled before its first step never enters run(), so clean up here
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            asyncio.create_task(release_sync_lock(lock_conn, job.source_table))
+
+    job.task = asyncio.create_task(run())
+    job.task.add_done_callback(on_done)
+    return job
+
+# Helper function to read the last migrated id. The per-batch checkpoint in the vector database is
+# committed together with the documents; migration_tracker is the fallback for databases synced before it.
+async def load_sync_checkpoint() -> int:
+    async with app.state.pgv_pool.connection() as pgv_conn:
+        pgv_cursor = await pgv_conn.execute(
+            "SELECT id_migrated FROM sync_checkpoint WHERE source_table = %s",
+            (SYNC_SOURCE_TABLE,)
+        )
+        row = await pgv_cursor.fetchone()
+    if row is not None:
+        return row[0]
+
+    # Get the last migrated ID from PostgreSQL
+    async with app.state.pg_pool.connection() as pg_conn:
+        pg_cursor = await pg_conn.execute("SELECT COALESCE(MAX(id_migrated), 0) FROM migration_tracker")
+        return (await pg_cursor.fetchone())[0]
+
+# Helper function to mirror the last migrated id to migration_tracker. It lives in a different database
+# and so cannot share the batch transactions. It is read with MAX(), so a rescan never moves it backwards.
+async def save_migration_tracker(last_id: int):
+    async with app.state.pg_pool.connection() as pg_conn:
+        await pg_conn.execute(
+            """
+            INSERT INTO migration_tracker (id_migrated)
+            VALUES (%s)
+            ON CONFLICT (id) DO UPDATE SET id_migrated = EXCLUDED.id_migrated
+            """,
+            (last_id,)
+        )
+
+# Helper function to count the MySQL rows a sync starting after after_id will read
+async def count_mysql_rows(after_id: int) -> int:
+    async with app.state.mysql_pool.acquire() as mysql_conn:
+        async with mysql_conn.cursor() as mysql_cursor:
+            await mysql_cursor.execute("SELECT COUNT(*) FROM tbl_genie_genie WHERE id > %s", (after_id,))
+            return (await mysql_cursor.fetchone())[0]
+
+# Sync MySQL rows into genie_documents. "incremental" only reads rows added since the last
+# migrated id; "changes" rescans the whole table and re-embeds rows whose content hash changed.
+async def run_sync(job: SyncJob) -> Dict:
+    last_migrated_id = 0
+    if job.kind == "incremental":
+        last_migrated_id = await load_sync_checkpoint()
+
+    job.rows_total = await count_mysql_rows(last_migrated_id)
+
+    synced, high_water_mark = await run_sync_pipeline(last_migrated_id, job)
+
+    if not synced:
+        return {"synced": 0, "changed": 0, "message": "No new rows to sync."}
+
+    await save_migration_tracker(high_water_mark)
+    return {"synced": synced, "changed": job.documents_changed, "last_migrated_id": high_water_mark}
+
+# Parallel sync configuration
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "4"))
+SYNC_RANGE_SIZE = int(os.getenv("SYNC_RANGE_SIZE", "20000"))
+
+# Sync one id range (after_id, until_id] in a worker process. Each call runs its own event loop
+# and lifespan, so the worker has its own MySQL and PostgreSQL pools and embedding client.
+# The worker gets embed_concurrency, its share of SYNC_EMBED_CONCURRENCY, and pools sized to match,
+# so all workers together stay within the connections and embedding requests of one sync.
+def sync_id_range(after_id: int, until_id: int, embed_concurrency: int) -> Tuple[int, int, int, int]:
+    global SYNC_EMBED_CONCURRENCY, PG_POOL_MIN_SIZE, PG_POOL_MAX_SIZE
+    SYNC_EMBED_CONCURRENCY = embed_concurrency
+    PG_POOL_MIN_SIZE = 1
+    # One connection per embed stage plus the writer's
+    PG_POOL_MAX_SIZE = embed_concurrency + 1
+
+    async def run():
+        async with lifespan(app):
+            job = SyncJob("range", SYNC_SOURCE_TABLE)
+            synced, _ = await run_sync_pipeline(after_id, job, until_id=until_id, checkpoint=False)
+            return synced, job.documents_changed, job.dedupe.texts, job.dedupe.unique_texts
+
+    try:
+        return asyncio.run(run())
+    except Exception as e:
+        # Driver exceptions do not always survive pickling back to the parent process
+        raise RuntimeError(f"Sync of ids {after_id + 1}-{until_id} failed: {str(e)}") from None
+
+# Incremental sync split into id ranges that run in a pool of worker processes. Ranges finish
+# out of order, so the checkpoint only advances over the contiguous prefix of completed ranges.
+async def run_parallel_sync(job: SyncJob) -> Dict:
+    last_migrated_id = await load_sync_checkpoint()
+
+    async with app.state.mysql_pool.acquire() as mysql_conn:
+        async with mysql_conn.cursor() as mysql_cursor:
+            await mysql_cursor.execute("SELECT COUNT(*), MAX(id) FROM tbl_genie_genie WHERE id > %s", (last_migrated_id,))
+            job.rows_total, max_id = await mysql_cursor.fetchone()
+
+    if not job.rows_total:
+        return {"synced": 0, "changed": 0, "message": "No new rows to sync."}
+
+    ranges = [
+        (low, min(low + SYNC_RANGE_SIZE, max_id))
+        for low in range(last_migrated_id, max_id, SYNC_RANGE_SIZE)
+    ]
+    workers = max(1, min(SYNC_WORKERS, len(ranges)))
+    embed_concurrency = max(1, SYNC_EMBED_CONCURRENCY // workers)
+    completed = set()
+    next_range = 0
+    high_water_mark = last_migrated_id
+    synced = 0
+
+    loop = asyncio.get_running_loop()
+    # spawn rather than fork, so workers do not inherit this process's open pools and event loop
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    futures = {
+        loop.run_in_executor(executor, sync_id_range, low, high, embed_concurrency): index
+        for index, (low, high) in enumerate(ranges)
+    }
+    pending = set(futures)
+    error: Optional[BaseException] = None
+    try:
+        # After a failure, ranges that have not started are cancelled but the loop keeps draining the
+        # running ones, so their results still count towards the checkpoint
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if future.cancelled():
+                    continue
+                if future.exception() is not None:
+                    if error is None:
+                        error = future.exception()
+                        executor.shutdown(wait=False, cancel_futures=True)
+                    continue
+                range_synced, range_changed, texts, unique_texts = future.result()
+                completed.add(futures[future])
+                synced += range_synced
+                job.rows_read += range_synced
+                job.rows_embedded += range_synced
+                job.rows_written += range_synced
+                job.documents_changed += range_changed
+                job.dedupe.record(texts, unique_texts)
+                app.state.embedding_dedupe.record(texts, unique_texts)
+
+            if next_range in completed:
+                while next_range in completed:
+                    high_water_mark = ranges[next_range][1]
+                    next_range += 1
+                async with app.state.pgv_pool.connection() as pgv_conn:
+                    await save_sync_checkpoint(pgv_conn, high_water_mark)
+    finally:
+        # Ranges that have not started are dropped. Ranges already running are waited for, also when
+        # the job is cancelled, so no worker is still writing once the job releases its sync lock.
+        executor.shutdown(wait=False, cancel_futures=True)
+        shutdown = loop.run_in_executor(None, executor.shutdown, True)
+        cancelled = False
+        while not shutdown.done():
+            try:
+                await asyncio.shield(shutdown)
+            except asyncio.CancelledError:
+                # A repeated cancel must not end the job while workers are still writing
+                cancelled = True
+        if cancelled:
+            raise asyncio.CancelledError()
+    if error is not None:
+        raise error
+
+    await save_migration_tracker(high_water_mark)
+    return {
+        "synced": synced,
+        "changed": job.documents_changed,
+        "last_migrated_id": high_water_mark,
+        "ranges": len(ranges),
+        "workers": workers,
+        "embed_concurrency_per_worker": embed_concurrency
+    }
+
+# Bulk load configuration
+BULK_LOAD_THRESHOLD = int(os.getenv("BULK_LOAD_THRESHOLD", "20000"))
+BULK_INDEX_MAINTENANCE_WORK_MEM = os.getenv("BULK_INDEX_MAINTENANCE_WORK_MEM", "2GB")
+BULK_INDEX_PARALLEL_WORKERS = int(os.getenv("BULK_INDEX_PARALLEL_WORKERS", "4"))
+
+# Helper function to drop the ANN indexes on genie_documents, returning their definitions
+# so they can be rebuilt. The unique source_id index is kept; the upsert needs it.
+async def drop_vector_indexes() -> List[Tuple[str, str]]:
+    async with app.state.pgv_pool.connection() as pgv_conn:
+        pgv_cursor = await pgv_conn.execute(
+            """
+            SELECT indexname, indexdef
+            FROM pg_indexes
+            WHERE schemaname = current_schema()
+                AND tablename = 'genie_documents'
+                AND (indexdef ILIKE '% USING hnsw %' OR indexdef ILIKE '% USING ivfflat %')
+            """
+        )
+        indexes = await pgv_cursor.fetchall()
+        for index_name, index_def in indexes:
+            # Logged so the index can be recreated by hand if the process dies before the rebuild
+            logger.info(f"Dropping vector index for bulk load: {index_def}")
+            await pgv_conn.execute(psycopg.sql.SQL("DROP INDEX IF EXISTS {}").format(psycopg.sql.Identifier(index_name)))
+    return indexes
+
+# Helper function to recreate dropped indexes with more memory and parallel workers for the build
+async def rebuild_vector_indexes(indexes: List[Tuple[str, str]]):
+    async with app.state.pgv_pool.connection() as pgv_conn:
+        await pgv_conn.execute(
+            """
+            SELECT set_config('maintenance_work_mem', %s, false),
+                   set_config('max_parallel_maintenance_workers', %s, false)
+            """,
+            (BULK_INDEX_MAINTENANCE_WORK_MEM, str(BULK_INDEX_PARALLEL_WORKERS))
+        )
+        try:
+            for _, index_def in indexes:
+                await pgv_conn.execute(index_def)
+                await pgv_conn.commit()
+        finally:
+            # The connection goes back to the pool; don't leave the build settings on it
+            await pgv_conn.rollback()
+            await pgv_conn.execute("RESET maintenance_work_mem")
+            await pgv_conn.execute("RESET max_parallel_maintenance_workers")
+
+# Incremental sync for large backlogs. When at least BULK_LOAD_THRESHOLD rows are new, the vector
+# indexes are dropped, the rows are loaded through the COPY pipeline and the indexes are built once at
+# the end, instead of being updated for every inserted row. Smaller backlogs sync with indexes in place.
+async def run_bulk_sync(job: SyncJob) -> Dict:
+    last_migrated_id = await load_sync_checkpoint()
+    job.rows_total = await count_mysql_rows(last_migrated_id)
+    if not job.rows_total:
+        return {"synced": 0, "changed": 0, "message": "No new rows to sync."}
+
+    bulk_load = job.rows_total >= BULK_LOAD_THRESHOLD
+    indexes = await drop_vector_indexes() if bulk_load else []
+
+    load_started = time.time()
+    try:
+        synced, high_water_mark = await run_sync_pipeline(last_migrated_id, job)
+    finally:
+        # Indexes are rebuilt even when the load fails part-way, so search never stays without them
+        load_seconds = time.time() - load_started
+        build_started = time.time()
+        if indexes:
+            await rebuild_vector_indexes(indexes)
+        build_seconds = time.time() - build_started
+
+    await save_migration_tracker(high_water_mark)
+    return {
+        "synced": synced,
+        "changed": job.documents_changed,
+        "last_migrated_id": high_water_mark,
+        "bulk_load": bulk_load,
+        "indexes_rebuilt": [index_name for index_name, _ in indexes],
+        "load_seconds": load_seconds,
+        "index_build_seconds": build_seconds
+    }
+
+# Binlog CDC configuration
+CDC_SERVER_ID = int(os.getenv("CDC_SERVER_ID", "4242"))
+CDC_BATCH_SIZE = int(os.getenv("CDC_BATCH_SIZE", "500"))
+CDC_FLUSH_INTERVAL = float(os.getenv("CDC_FLUSH_INTERVAL", "1.0"))
+
+# Helper function to read the saved binlog position for the source table
+async def load_binlog_checkpoint() -> Tuple[Optional[str], Optional[int]]:
+    async with app.state.pg_pool.connection() as pg_conn:
+        pg_cursor = await pg_conn.execute(
+            "SELECT log_file, log_pos FROM binlog_checkpoint WHERE source_table = %s",
+            (SYNC_SOURCE_TABLE,)
+        )
+        row = await pg_cursor.fetchone()
+    return (row[0], row[1]) if row else (None, None)
+
+# Helper function to save the binlog position reached by the CDC job
+async def save_binlog_checkpoint(log_file: str, log_pos: int):
+    async with app.state.pg_pool.connection() as pg_conn:
+        await pg_conn.execute(
+            """
+            INSERT INTO binlog_checkpoint (source_table, log_file, log_pos, updated_at)
+            VALUES (%s, %s, %s, NOW())
+            ON CONFLICT (source_table) DO UPDATE SET
+                log_file = EXCLUDED.log_file,
+                log_pos = EXCLUDED.log_pos,
+                updated_at = EXCLUDED.updated_at
+            """,
+            (SYNC_SOURCE_TABLE, log_file, log_pos)
+        )
+
+# Tail the MySQL binlog (row-based) in a worker thread and hand row changes and
+# transaction commits to the event loop. Heartbeats let the thread notice a stop request.
+def read_binlog(loop, queue: asyncio.Queue, stop: threading.Event, log_file: Optional[str], log_pos: Optional[int]):
+    # Imported here so deployments that never run CDC don't need mysql-replication installed
+    from pymysqlreplication import BinLogStreamReader
+    from pymysqlreplication.event import HeartbeatLogEvent, XidEvent
+    from pymysqlreplication.row_event import DeleteRowsEvent, UpdateRowsEvent, WriteRowsEvent
+
+    stream = BinLogStreamReader(
+        connection_settings={
+            "host": os.getenv("DB_HOST"),
+            "port": int(os.getenv("DB_PORT")),
+            "user": os.getenv("DB_USER"),
+            "passwd": os.getenv("DB_PASSWORD")
+        },
+        server_id=CDC_SERVER_ID,
+        only_events=[WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent, XidEvent, HeartbeatLogEvent],
+        only_schemas=[os.getenv("DB_NAME", "db_ses")],
+        only_tables=[SYNC_SOURCE_TABLE],
+        log_file=log_file,
+        log_pos=log_pos,
+        resume_stream=True,
+        blocking=True,
+        slave_heartbeat=1.0
+    )
+
+    def put(item):
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while not stop.is_set():
+            try:
+                return future.result(timeout=1)
+            except TimeoutError:
+                continue
+        future.cancel()
+
+    try:
+        for event in stream:
+            if stop.is_set():
+                break
+            if isinstance(event, XidEvent):
+                put(("commit", stream.log_file, stream.log_pos))
+            elif isinstance(event, DeleteRowsEvent):
+                for row in event.rows:
+                    put(("delete", row["values"]))
+            elif isinstance(event, UpdateRowsEvent):
+                for row in event.rows:
+                    put(("upsert", row["after_values"]))
+            elif isinstance(event, WriteRowsEvent):
+                for row in event.rows:
+                    put(("upsert", row["values"]))
+    finally:
+        stream.close()
+
+# Helper function to apply a batch of binlog row changes to genie_documents
+async def apply_binlog_changes(changes: Dict[int, Tuple[str, Dict]]) -> Tuple[int, int]:
+    upserts = [row for op, row in changes.values() if op == "upsert"]
+    deleted_ids = [source_id for source_id, (op, _) in changes.items() if op == "delete"]
+
+    documents = await prepare_documents(upserts) if upserts else []
+    deleted = 0
+    async with app.state.pgv_pool.connection() as pgv_conn:
+        if deleted_ids:
+            pgv_cursor = await pgv_conn.execute(
+                "DELETE FROM genie_documents WHERE source_id = ANY(%s)",
+                (deleted_ids,)
+            )
+            deleted = pgv_cursor.rowcount
+        await bulk_upsert_documents(pgv_conn, documents)
+    return len(documents), deleted
+
+# Change-data-capture sync: tails the binlog and applies inserts, updates and deletes in batches.
+# Batches are applied at transaction boundaries and the binlog position is saved as the checkpoint.
+async def run_cdc(job: SyncJob) -> Dict:
+    log_file, log_pos = await load_binlog_checkpoint()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=CDC_BATCH_SIZE * 2)
+    stop = threading.Event()
+    reader = loop.run_in_executor(None, read_binlog, loop, queue, stop, log_file, log_pos)
+
+    # Changes from the transaction being read, and from committed transactions not yet applied
+    transaction: Dict[int, Tuple[str, Dict]] = {}
+    batch: Dict[int, Tuple[str, Dict]] = {}
+    position: Optional[Tuple[str, int]] = None
+    last_flush = time.monotonic()
+    deleted = 0
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=CDC_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                item = None
+                if reader.done():
+                    # Surface errors from the binlog thread
+                    reader.result()
+                    raise RuntimeError("Binlog reader stopped unexpectedly")
+
+            if item is not None and item[0] == "commit":
+                batch.update(transaction)
+                transaction = {}
+                position = (item[1], item[2])
+            elif item is not None:
+                op, row = item
+                transaction[row["id"]] = (op, row)
+                job.rows_read += 1
+
+            if position is not None and (len(batch) >= CDC_BATCH_SIZE or time.monotonic() - last_flush >= CDC_FLUSH_INTERVAL):
+                if batch:
+                    written, removed = await apply_binlog_changes(batch)
+                    job.rows_written += len(batch)
+                    job.documents_changed += written
+                    deleted += removed
+                await save_binlog_checkpoint(*position)
+                job.result = {"log_file": position[0], "log_pos": position[1], "deleted": deleted}
+                batch = {}
+                position = None
+                last_flush = time.monotonic()
+    finally:
+        stop.set()
+
+# Delete reconciliation configuration
+RECONCILE_BLOCK_SIZE = int(os.getenv("RECONCILE_BLOCK_SIZE", "1000"))
+
+# Remove documents whose MySQL row no longer exists. Both sides are summarized per block of ids
+# (count, sum and xor of the ids) and only blocks whose checksums differ have their ids compared.
+async def run_reconcile(job: SyncJob) -> Dict:
+    async with app.state.mysql_pool.acquire() as mysql_conn:
+        async with mysql_conn.cursor() as mysql_cursor:
+            await mysql_cursor.execute(
+                """
+                SELECT id DIV %s AS block, COUNT(*), SUM(id), BIT_XOR(id)
+                FROM tbl_genie_genie
+                GROUP BY block
+                """,
+                (RECONCILE_BLOCK_SIZE,)
+            )
+            mysql_blocks = {
+                int(block): (int(count), int(total), int(xor))
+                for block, count, total, xor in await mysql_cursor.fetchall()
+            }
+
+    async with app.state.pgv_pool.connection() as pgv_conn:
+        pgv_cursor = await pgv_conn.execute(
+            """
+            SELECT source_id / %s AS block, COUNT(*), SUM(source_id), BIT_XOR(source_id)
+            FROM genie_documents
+            WHERE source_id IS NOT NULL
+            GROUP BY block
+            """,
+            (RECONCILE_BLOCK_SIZE,)
+        )
+        pgv_blocks = {
+            int(block): (int(count), int(total), int(xor))
+            for block, count, total, xor in await pgv_cursor.fetchall()
+        }
+        pgv_cursor = await pgv_conn.execute("SELECT COUNT(*) FROM genie_documents WHERE source_id IS NULL")
+        unmapped = (await pgv_cursor.fetchone())[0]
+
+    mismatched = sorted(block for block, checksum in pgv_blocks.items() if mysql_blocks.get(block) != checksum)
+    job.rows_total = len(pgv_blocks)
+    job.rows_read = len(pgv_blocks) - len(mismatched)
+
+    deleted = 0
+    for block in mismatched:
+        low = block * RECONCILE_BLOCK_SIZE
+        high = low + RECONCILE_BLOCK_SIZE
+        mysql_ids = set()
+        if block in mysql_blocks:
+            async with app.state.mysql_pool.acquire() as mysql_conn:
+                async with mysql_conn.cursor() as mysql_cursor:
+                    await mysql_cursor.execute(
+                        "SELECT id FROM tbl_genie_genie WHERE id >= %s AND id < %s",
+                        (low, high)
                     )
+                    mysql_ids = {row[0] for row in await mysql_cursor.fetchall()}
 
-            for row in rows:
-                question = row.get('genie_question') or ""
-                if question in existing_questions:
-                    continue  # Skip if question already exists
-
-                answer = row.get('genie_answer') or ""
-
-                with pgv_conn.cursor() as pgv_cursor:
-                    try:
-                        pgv_cursor.execute(
-                            """
-                            INSERT INTO genie_documents (question, answer, link, date)
-                            VALUES (%s, %s, %s, %s)
-                            ON CONFLICT (question) DO UPDATE SET date = EXCLUDED.date
-                            RETURNING id
-                            """,
-                            (question, answer, row.get('genie_sourcelink'), row['genie_questiondate'])
-                        )
-                        question_id = pgv_cursor.fetchone()[0]
-                    except psycopg2.Error as e:
-                        logger.error(f"Insert error on genie_documents: {str(e)}")
-                        pgv_conn.rollback()
-                        raise HTTPException(
-                            status_code=503,
-                            detail=f"Insert error on genie_documents: {str(e)}"
-                        )
-
-                update_embeddings_in_pgv(pgv_conn, question_id, question, answer)
-
-            with pg_conn.cursor() as pg_cursor:
-                pg_cursor.execute(
+        async with app.state.pgv_pool.connection() as pgv_conn:
+            pgv_cursor = await pgv_conn.execute(
+                "SELECT source_id FROM genie_documents WHERE source_id >= %s AND source_id < %s",
+                (low, high)
+            )
+            orphans = [row[0] for row in await pgv_cursor.fetchall() if row[0] not in mysql_ids]
+            if orphans:
+                pgv_cursor = await pgv_conn.execute(
+                    "DELETE FROM genie_documents WHERE source_id = ANY(%s)",
+                    (orphans,)
+                )
+                deleted += pgv_cursor.rowcount
+                job.rows_written += pgv_cursor.rowcount
+        job.rows_read += 1
+
+    return {
+        "blocks_checked": len(pgv_blocks),
+        "blocks_mismatched": len(mismatched),
+        "deleted": deleted,
+        # Documents synced before source ids were recorded cannot be matched to MySQL rows
+        "unmapped": unmapped
+    }
+
+# Embedding backfill configuration
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "500"))
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "4"))
+
+# An embedding needs backfilling when it is missing for non-empty text, all zeros (the fallback for a
+# failed embedding request) or of the wrong dimension. Empty texts are stored without an embedding.
+# The casts let this work on halfvec columns too.
+BROKEN_EMBEDDING_SQL = """
+    (({column} IS NULL AND COALESCE({text}, '') ~ '\\S')
+        OR vector_norm({column}::vector) = 0
+        OR vector_dims({column}::vector) <> %(dim)s)
+"""
+
+# Re-embed documents whose question or answer embedding is broken. Documents are found by keyset
+# scan over genie_documents.id and re-embedded in batches, with a bounded number of batches in flight.
+async def run_backfill(job: SyncJob) -> Dict:
+    question_broken = BROKEN_EMBEDDING_SQL.format(column="question_embedding", text="question")
+    answer_broken = BROKEN_EMBEDDING_SQL.format(column="answer_embedding", text="answer")
+    params = {"dim": EMBEDDING_DIM}
+
+    async with app.state.pgv_pool.connection() as pgv_conn:
+        pgv_cursor = await pgv_conn.execute(
+            f"SELECT COUNT(*) FROM genie_documents WHERE {question_broken} OR {answer_broken}",
+            params
+        )
+        job.rows_total = (await pgv_cursor.fetchone())[0]
+
+    in_flight = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+    tasks: List[asyncio.Task] = []
+    fixed = 0
+
+    async def backfill_batch(rows: List[Tuple]):
+        nonlocal fixed
+        try:
+            # Only the broken side of each document is re-embedded
+            texts: List[str] = []
+            for _, question, answer, fix_question, fix_answer in rows:
+                if fix_question:
+                    texts.append(question or "")
+                if fix_answer:
+                    texts.append(answer or "")
+            embeddings = iter(await embed_texts(texts, raise_on_error=True, limiter=app.state.sync_embed_limiter))
+            job.rows_embedded += len(rows)
+
+            # A fixed side whose text is empty is set to NULL
+            updates = [
+                (
+                    fix_question,
+                    next(embeddings) if fix_question else None,
+                    fix_answer,
+                    next(embeddings) if fix_answer else None,
+                    document_id
+                )
+                for document_id, _, _, fix_question, fix_answer in rows
+            ]
+            async with app.state.pgv_pool.connection() as pgv_conn, pgv_conn.cursor() as pgv_cursor:
+                await pgv_cursor.executemany(
                     """
-                    INSERT INTO migration_tracker (id_migrated)
-                    VALUES (%s)
-                    ON CONFLICT (id) DO UPDATE SET id_migrated = EXCLUDED.id_migrated
+                    UPDATE genie_documents
+                    SET question_embedding = CASE WHEN %s THEN %b ELSE question_embedding END,
+                        answer_embedding = CASE WHEN %s THEN %b ELSE answer_embedding END
+                    WHERE id = %s
                     """,
-                    (rows[-1]['id'],)
+                    updates
                 )
-            pg_conn.commit()
-            pgv_conn.commit()
-            return {"status": "success", "synced": len(rows)}
-        except psycopg2.Error as e:
-            logger.error(f"PostgreSQL query error: {str(e)}")
-            pgv_conn.rollback()
-            pg_conn.rollback()
-            raise HTTPException(
-                status_code=503,
-                detail=f"PostgreSQL query error: {str(e)}"
-            )
+            fixed += len(rows)
+            job.rows_written += len(rows)
+            job.documents_changed += len(rows)
         finally:
-            # Connections are managed by lifespan, no need to close here
-            pass
+            in_flight.release()
 
-    except aiomysql.Error as e:
-        logger.error(f"MySQL service unavailable: {str(e)}")
-        raise HTTPException(
-            status_code=503,
-            detail=f"MySQL service unavailable: {str(e)}"
-        )
-    except psycopg2.OperationalError as e:
-        logger.error(f"PostgreSQL connection error: {str(e)}")
+    try:
+        last_id = 0
+        while True:
+            async with app.state.pgv_pool.connection() as pgv_conn:
+                pgv_cursor = await pgv_conn.execute(
+                    f"""
+                    SELECT id, question, answer, {question_broken} AS fix_question, {answer_broken} AS fix_answer
+                    FROM genie_documents
+                    WHERE id > %(after_id)s AND ({question_broken} OR {answer_broken})
+                    ORDER BY id
+                    LIMIT %(limit)s
+                    """,
+                    {**params, "after_id": last_id, "limit": BACKFILL_BATCH_SIZE}
+                )
+                rows = await pgv_cursor.fetchall()
+            if not rows:
+                break
+            job.rows_read += len(rows)
+            last_id = rows[-1][0]
+
+            await in_flight.acquire()
+            tasks.append(asyncio.create_task(backfill_batch(rows)))
+            # Surface a failed batch straight away instead of after the whole scan
+            for task in [task for task in tasks if task.done()]:
+                tasks.remove(task)
+                task.result()
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return {"fixed": fixed}
+
+@app.post('/documents/sync-embeddings', status_code=202)
+async def sync_embeddings(mode: str = "incremental"):
+    """
+    Start a background sync of MySQL rows into pgvector.
+    mode=incremental syncs rows added since the last run; mode=parallel does the
+    same across id ranges in worker processes; mode=bulk defers vector index
+    builds until a large backlog is loaded; mode=changes rescans the table
+    and re-embeds only rows whose content changed; mode=cdc keeps running and
+    applies inserts, updates and deletes from the MySQL binlog.
+    Poll /documents/sync-jobs/{job_id} for progress.
+    """
+    runners = {
+        "incremental": run_sync,
+        "changes": run_sync,
+        "parallel": run_parallel_sync,
+        "bulk": run_bulk_sync,
+        "cdc": run_cdc
+    }
+    if mode not in runners:
         raise HTTPException(
-            status_code=503,
-            detail=f"PostgreSQL connection error: {str(e)}"
+            status_code=422,
+            detail=f"Unknown sync mode: {mode}"
         )
-    except requests.RequestException as e:
-        logger.error(f"Embedding service unavailable: {str(e.response.text) if hasattr(e, 'response') and e.response else str(e)}")
+    job = await start_sync_job(mode, runners[mode])
+    return job.snapshot()
+
+@app.post('/documents/reconcile', status_code=202)
+async def reconcile_documents():
+    """
+    Start a background job that deletes documents whose MySQL row was removed.
+    Poll /documents/sync-jobs/{job_id} for progress and the number of rows deleted.
+    """
+    job = await start_sync_job("reconcile", run_reconcile)
+    return job.snapshot()
+
+@app.post('/documents/backfill-embeddings', status_code=202)
+async def backfill_embeddings():
+    """
+    Start a background job that re-embeds documents whose embeddings are missing,
+    all zeros or of the wrong dimension.
+    Poll /documents/sync-jobs/{job_id} for progress and the number of documents fixed.
+    """
+    job = await start_sync_job("backfill", run_backfill)
+    return job.snapshot()
+
+@app.get('/documents/sync-jobs')
+async def list_sync_jobs():
+    return [job.snapshot() for job in reversed(app.state.sync_jobs.values())]
+
+@app.get('/documents/sync-jobs/{job_id}')
+async def get_sync_job(job_id: str):
+    job = app.state.sync_jobs.get(job_id)
+    if job is None:
         raise HTTPException(
-            status_code=503,
-            detail=f"Embedding service unavailable: {str(e.response.text) if hasattr(e, 'response') and e.response else str(e)}"
+            status_code=404,
+            detail=f"Sync job {job_id} not found"
         )
-    except Exception as e:
-        logger.error(f"Server error: {str(e)}")
+    return job.snapshot()
+
+@app.post('/documents/sync-jobs/{job_id}/cancel')
+async def cancel_sync_job(job_id: str):
+    job = app.state.sync_jobs.get(job_id)
+    if job is None:
         raise HTTPException(
-            status_code=500,
-            detail=f"Server error: {str(e)}"
+            status_code=404,
+            detail=f"Sync job {job_id} not found"
         )
+    if job.task is not None and not job.task.done():
+        job.task.cancel()
+        try:
+            await job.task
+        except asyncio.CancelledError:
+            pass
+    return job.snapshot()
+
+@app.get("/stats")
+async def stats():
+    return {
+        "query_embedding_cache": app.state.query_embedding_cache.stats(),
+        "query_embedding_flights": app.state.query_embedding_flights.stats(),
+        "embedding_dedupe": app.state.embedding_dedupe.stats(),
+        "embedding_store": app.state.embedding_store.stats() if app.state.embedding_store is not None else None
+    }
 
 @app.get("/healthcheck")
 async def healthcheck():
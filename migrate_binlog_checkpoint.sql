@@ -0,0 +1,10 @@
+-- Add the binlog position checkpoint used by sync-embeddings?mode=cdc.
+-- Run against PG_DB_NAME (the database holding migration_tracker).
+CREATE TABLE IF NOT EXISTS binlog_checkpoint (
+    source_table TEXT PRIMARY KEY,
+    log_file TEXT NOT NULL,
+    log_pos BIGINT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+GRANT SELECT, INSERT, UPDATE ON binlog_checkpoint TO sainschat_user;
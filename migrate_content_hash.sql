@@ -0,0 +1,3 @@
+-- Add the per-document content hash used by sync-embeddings?mode=changes
+-- to re-embed only MySQL rows that were edited since they were last synced.
+ALTER TABLE genie_documents ADD COLUMN IF NOT EXISTS content_hash TEXT;
@@ -0,0 +1,22 @@
+-- Migrate genie_documents to halfvec storage with HNSW indexes (requires pgvector >= 0.7.0).
+-- Run once, then set VECTOR_INDEX_MODE=halfvec_hnsw.
+--
+-- HNSW can index at most 4000 halfvec dimensions, so the 4096-dim embeddings are indexed
+-- through their binary quantization and search re-ranks the candidates by cosine distance.
+
+-- The ivfflat indexes from older versions of setup_pg_vdb.sql cannot be built above 2000 dimensions
+DROP INDEX IF EXISTS genie_documents_question_embedding_idx;
+DROP INDEX IF EXISTS genie_documents_answer_embedding_idx;
+
+-- Store embeddings at half precision (halves table and index size)
+ALTER TABLE genie_documents
+    ALTER COLUMN question_embedding TYPE halfvec(4096) USING question_embedding::halfvec(4096),
+    ALTER COLUMN answer_embedding TYPE halfvec(4096) USING answer_embedding::halfvec(4096);
+
+-- Create HNSW indexes over the binary-quantized embeddings
+CREATE INDEX IF NOT EXISTS genie_documents_question_embedding_hnsw_idx
+    ON genie_documents USING hnsw ((binary_quantize(question_embedding)::bit(4096)) bit_hamming_ops);
+CREATE INDEX IF NOT EXISTS genie_documents_answer_embedding_hnsw_idx
+    ON genie_documents USING hnsw ((binary_quantize(answer_embedding)::bit(4096)) bit_hamming_ops);
+
+ANALYZE genie_documents;
@@ -0,0 +1,6 @@
+-- Record the tbl_genie_genie id each document was synced from, so deletes in MySQL
+-- can be reconciled (POST /documents/reconcile) and applied by the CDC sync.
+ALTER TABLE genie_documents ADD COLUMN IF NOT EXISTS source_id INTEGER;
+CREATE INDEX IF NOT EXISTS genie_documents_source_id_idx ON genie_documents (source_id);
+
+GRANT DELETE ON genie_documents TO sainschat_user;
@@ -0,0 +1,11 @@
+-- Key genie_documents by the MySQL row id instead of the question text.
+-- Run after migrate_source_id.sql. Sync upserts on source_id, and documents that
+-- predate it are matched to their MySQL row by question the next time that row is synced.
+DROP INDEX IF EXISTS genie_documents_source_id_idx;
+CREATE UNIQUE INDEX IF NOT EXISTS genie_documents_source_id_key ON genie_documents (source_id);
+
+-- MySQL rows may share a question, so questions no longer have to be unique
+ALTER TABLE genie_documents DROP CONSTRAINT IF EXISTS unique_question;
+
+-- Small index for matching documents that do not have a source_id yet
+CREATE INDEX IF NOT EXISTS genie_documents_legacy_question_idx ON genie_documents (question) WHERE source_id IS NULL;
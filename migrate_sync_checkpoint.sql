@@ -0,0 +1,11 @@
+-- Add the per-batch sync checkpoint used by sync-embeddings.
+-- Run against PGVECTOR_DB_NAME (the database holding genie_documents), so the
+-- checkpoint can be committed in the same transaction as each batch of documents.
+-- Until the first batch is written, the sync falls back to migration_tracker.
+CREATE TABLE IF NOT EXISTS sync_checkpoint (
+    source_table TEXT PRIMARY KEY,
+    id_migrated INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+GRANT SELECT, INSERT, UPDATE ON sync_checkpoint TO sainschat_user;
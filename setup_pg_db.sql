@@ -9,4 +9,14 @@ INSERT INTO migration_tracker (id_migrated) VALUES (0);
 
 -- Grant permission to user
 GRANT SELECT, INSERT, UPDATE ON migration_tracker TO sainschat_user;
-GRANT ALL ON SEQUENCE migration_tracker_id_seq TO sainschat_user;
\ No newline at end of file
+GRANT ALL ON SEQUENCE migration_tracker_id_seq TO sainschat_user;
+
+-- Create binlog_checkpoint table (binlog position for sync-embeddings?mode=cdc)
+CREATE TABLE IF NOT EXISTS binlog_checkpoint (
+    source_table TEXT PRIMARY KEY,
+    log_file TEXT NOT NULL,
+    log_pos BIGINT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+GRANT SELECT, INSERT, UPDATE ON binlog_checkpoint TO sainschat_user;
@@ -2,19 +2,30 @@ DROP TABLE genie_documents;
 
 CREATE TABLE genie_documents (
     id SERIAL PRIMARY KEY,
+    source_id INTEGER,
     question TEXT NOT NULL,
     answer TEXT,
     link TEXT,
     date TIMESTAMP,
+    content_hash TEXT,
     question_embedding VECTOR(4096),
     answer_embedding VECTOR(4096)
 );
 
--- Create indexes for vector search
-CREATE INDEX ON genie_documents USING ivfflat (question_embedding vector_cosine_ops);
-CREATE INDEX ON genie_documents USING ivfflat (answer_embedding vector_cosine_ops);
-ALTER TABLE genie_documents ADD CONSTRAINT unique_question UNIQUE (question);
+-- pgvector cannot index 4096-dim vector columns (ivfflat/HNSW stop at 2000 dimensions).
+-- For indexed search, run migrate_halfvec_hnsw.sql and set VECTOR_INDEX_MODE=halfvec_hnsw.
+CREATE UNIQUE INDEX genie_documents_source_id_key ON genie_documents (source_id);
+CREATE INDEX genie_documents_legacy_question_idx ON genie_documents (question) WHERE source_id IS NULL;
 
 -- Grant permissions to user
-GRANT SELECT, INSERT, UPDATE ON genie_documents TO sainschat_user;
+GRANT SELECT, INSERT, UPDATE, DELETE ON genie_documents TO sainschat_user;
 GRANT ALL ON SEQUENCE genie_documents_id_seq TO sainschat_user;
+
+-- Create sync_checkpoint table (last synced MySQL id, committed with each batch of documents)
+CREATE TABLE IF NOT EXISTS sync_checkpoint (
+    source_table TEXT PRIMARY KEY,
+    id_migrated INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+GRANT SELECT, INSERT, UPDATE ON sync_checkpoint TO sainschat_user;